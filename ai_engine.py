@@ -4,15 +4,19 @@ import numpy as np
 import re
 import json
 import os
+from gemini_scheduler import GovernedClient, INTERACTIVE
+from identity import IdentityResolver, normalize_name, get_identity, add_student_ids, join_on_student
 
 SCORE_COLS = ['score_proj', 'score_spatial', 'score_conv', 'score_views', 'score_efficacy', 'score_model']
 CAT_COLS   = ["cat_convert_rep", "cat_dims_props", "cat_proj_trans", "cat_3d_support"]
 
 def clean_name(val: str) -> str:
-    if pd.isna(val): return ""
-    val = str(val).strip().lower()
-    val = re.sub(r"[^\w]", "", val)
-    return val
+    # נשאר לתאימות - הנרמול היחיד של שמות נמצא ב-identity.py
+    return normalize_name(val)
+
+def active_identity() -> IdentityResolver:
+    from partitions import DEFAULT_PARTITION, partition_identity_file
+    return get_identity(partition_identity_file(st.session_state.get("partition_id", DEFAULT_PARTITION)))
 
 def student_observations(df_master: pd.DataFrame, name_key: str) -> pd.DataFrame:
     sub = df_master[df_master["name_key"] == name_key].copy()
@@ -27,13 +31,13 @@ def get_pre_post_cols(df: pd.DataFrame):
     post_cols = sorted(post_cols, key=lambda c: int(re.search(r"\d+", c).group()))
     return pre_cols, post_cols
 
-def load_master_local(file) -> pd.DataFrame:
+def load_master_local(file, resolver: IdentityResolver | None = None) -> pd.DataFrame:
     df = pd.read_excel(file) if file.name.endswith(".xlsx") else pd.read_csv(file)
-    df["name_key"] = df["student_name"].apply(clean_name)
+    add_student_ids(df, "student_name", resolver or active_identity(), register=True)
     df["date"]     = pd.to_datetime(df.get("date", pd.NaT), errors="coerce")
     return df
 
-def load_prepost_local(file) -> pd.DataFrame | None:
+def load_prepost_local(file, resolver: IdentityResolver | None = None) -> pd.DataFrame | None:
     raw = pd.read_excel(file, header=None) if file.name.endswith(".xlsx") else pd.read_csv(file, header=None)
     header_row = 0
     for idx, row in raw.iterrows():
@@ -46,7 +50,8 @@ def load_prepost_local(file) -> pd.DataFrame | None:
     df = df.rename(columns={name_col: "name"})
     df = df.loc[:, ~df.columns.duplicated()].copy()
     df = df[df["name"].notna() & (df["name"].astype(str).str.strip() != "")]
-    df["name_key"] = df["name"].astype(str).apply(clean_name)
+    # שאלונים לא יוצרים תלמידים חדשים - שם שלא זוהה נשאר בלי student_id (ראה טבלת הכינויים)
+    add_student_ids(df, "name", resolver or active_identity(), register=False)
     df.index = range(len(df))
     return df
 
@@ -74,7 +79,7 @@ def init_gemini(api_key: str):
     import google.generativeai as genai
     genai.configure(api_key=api_key)
     model = genai.GenerativeModel("gemini-2.5-flash", system_instruction=SYSTEM_RULES)
-    return model.start_chat(history=[])
+    return GovernedClient(model.start_chat(history=[]), INTERACTIVE)
 
 def render_ai_agent_tab():
     st.subheader("🤖 סוכן ניתוח ממצאים (שיחה משורשרת)")
@@ -101,6 +106,9 @@ def render_ai_agent_tab():
                 elif 'preq' in combined_text or 'post' in combined_text or 'q1_pre' in combined_text:
                     df_pp_local = load_prepost_local(file)
                     st.success(f"✅ קובץ שאלונים (Pre/Post) נטען בהצלחה: {file.name}")
+                    unmatched = df_pp_local.loc[df_pp_local["student_id"].isna(), "name"].astype(str).unique()
+                    if len(unmatched):
+                        st.warning(f"⚠️ שמות בשאלונים שלא זוהו כתלמידים (הוסף כינוי בטאב הסנכרון): {', '.join(unmatched)}")
             except Exception as e:
                 st.error(f"שגיאה בעיבוד הקובץ {file.name}: {e}")
 
@@ -152,6 +160,19 @@ def render_ai_agent_tab():
                             }
                 global_stats_payload["error_categories_stats_all_class"] = cats_summary
 
+                from growth_model import get_engine, dataset_key
+                from partitions import DEFAULT_PARTITION
+                if "student_id" not in active_master.columns: add_student_ids(active_master, "student_name", active_identity())
+                # מנוע לכל כיתה ומערך נתונים - סשנים עם קבצים שונים לא דורסים זה את זה
+                engine = get_engine(f"agent:{st.session_state.get('partition_id', DEFAULT_PARTITION)}:{dataset_key(active_master)}")
+                global_stats_payload.update(engine.update_payload(active_master))
+
+            if active_master is not None and active_pp is not None:
+                for df_src, col in ((active_master, "student_name"), (active_pp, "name")):
+                    if "student_id" not in df_src.columns: add_student_ids(df_src, col, active_identity())
+                joined = join_on_student(active_master[["student_id"]].drop_duplicates(), active_pp[["student_id"]].drop_duplicates())
+                global_stats_payload["students_with_observations_and_questionnaire"] = int(len(joined))
+
             if active_pp is not None:
                 pre_q_cols, post_q_cols = get_pre_post_cols(active_pp)
                 if pre_q_cols and post_q_cols:
@@ -9,8 +9,17 @@ import requests
 from datetime import date, datetime
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
+from googleapiclient.http import MediaIoBaseDownload
 from streamlit_mic_recorder import mic_recorder
+from image_pipeline import ImageIndex, stage_images
+from local_store import DATA_LOCK
+from gemini_scheduler import (get_scheduler, GovernedClient, RateLimitedError, SchedulerBusyError, DeadlineExceededError,
+                              INTERACTIVE, REFLECTION, BATCH, PRIORITY_LABELS)
+from bulk_import import import_stream, existing_keys
+from identity import get_identity, add_student_ids
+from growth_model import get_engine
+from partitions import build_partitions, partition_summary, write_summary, aggregate_view
+from upload_queue import UploadQueue, DriveBackend, LocalDriveBackend, QueueFullError, PENDING_PREFIX
 
 # --- חיבור למנוע הסטטיסטי (ai_engine.py) ---
 try:
@@ -22,8 +31,8 @@ except ImportError:
 # ==========================================
 # --- 0. הגדרות מערכת ועיצוב ---
 # ==========================================
-DATA_FILE = "reflections.jsonl"
 MASTER_FILENAME = "All_Observations_Master.xlsx"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
 # תיקיית האם (לתמונות ותצפיות רגילות)
 GDRIVE_FOLDER_ID = st.secrets.get("GDRIVE_FOLDER_ID")
@@ -32,6 +41,13 @@ GDRIVE_FOLDER_ID = st.secrets.get("GDRIVE_FOLDER_ID")
 INTERVIEW_FOLDER_ID = "1NQz2UZ6BfAURfN4a8h4_qSkyY-_gxhxP"
 
 CLASS_ROSTER = ["נתנאל", "רועי", "אסף", "עילאי", "טדי", "מירון", "אופק", "דניאל.ר", "אלי", "טיגרן", "פולינה.ק", "תלמיד אחר..."]
+# הכיתה המקורית היא מחיצת ברירת המחדל; כיתות/מחזורים נוספים מוגדרים ב-secrets תחת [partitions.<id>]
+PARTITIONS = build_partitions({
+    "label": "כיתה ראשית", "roster": CLASS_ROSTER, "gdrive_folder_id": GDRIVE_FOLDER_ID,
+    "interview_folder_id": INTERVIEW_FOLDER_ID, "master_file_id": st.secrets.get("MASTER_FILE_ID")
+})
+for _p in PARTITIONS.values():
+    get_identity(_p["identity_file"]).register_roster(_p["roster"])
 TAGS_OPTIONS = ["התעלמות מקווים נסתרים", "בלבול בין היטלים", "קושי ברוטציה מנטלית", "טעות בפרופורציות", "קושי במעבר בין היטלים", "שימוש בכלי מדידה", "סיבוב פיזי של המודל", "תיקון עצמי", "עבודה עצמאית שוטפת"]
 st.set_page_config(page_title="מערכת תצפית מחקרית - 54.0", layout="wide")
 
@@ -81,39 +97,59 @@ st.markdown("""
 # --- 1. פונקציות לוגיקה (נתונים ו-AI) ---
 # ==========================================
 
-def normalize_name(name):
-    if not isinstance(name, str): return ""
-    import re
-    # 1. הסרת רווחים לפני הכל (הטיפ של קופיילוט)
-    name = name.replace(" ", "")
-    # 2. השארת רק אותיות ומספרים (ניקוי נקודות, מקפים וכו')
-    clean = re.sub(r'[^א-תa-zA-Z0-9]', '', name)
-    return clean.strip().lower()
-
 @st.cache_resource
-def get_drive_service():
+def get_drive_credentials():
     try:
         b64 = st.secrets.get("GDRIVE_SERVICE_ACCOUNT_B64")
         js = base64.b64decode("".join(b64.split())).decode("utf-8")
-        creds = Credentials.from_service_account_info(json.loads(js), scopes=["https://www.googleapis.com/auth/drive"])
-        return build("drive", "v3", credentials=creds)
+        return Credentials.from_service_account_info(json.loads(js), scopes=["https://www.googleapis.com/auth/drive"])
+    except: return None
+
+@st.cache_resource
+def get_drive_service():
+    creds = get_drive_credentials()
+    if creds is None: return None
+    try: return build("drive", "v3", credentials=creds)
     except: return None
 
+@st.cache_resource
+def get_image_index():
+    return ImageIndex()
+
+@st.cache_resource
+def get_upload_queue():
+    # תור אחד לכל התהליך; DRIVE_BACKEND="local" מאפשר עבודה מול תיקייה מקומית בלי רשת
+    if st.secrets.get("DRIVE_BACKEND") == "local":
+        backend = LocalDriveBackend()
+    else:
+        creds = get_drive_credentials()
+        backend = DriveBackend(creds) if creds else None
+    queue = UploadQueue(backend)
+    queue.add_listener(get_image_index().on_upload_done)   # לפני start, כדי לא לפספס משימות ששוחזרו מהדיסק
+    return queue.start()
+
 @st.cache_data(ttl=300)
-def load_full_dataset(_svc):
+def load_full_dataset(_svc, part_id):
+    # נטען ונשמר במטמון רק עבור הכיתה שנבחרה (part_id הוא חלק ממפתח המטמון)
+    part = PARTITIONS[part_id]
+    data_file = part["data_file"]
     df_drive = pd.DataFrame()
-    file_id = st.secrets.get("MASTER_FILE_ID")
+    file_id = part["master_file_id"]
+    staged = get_upload_queue().pending_update(file_id) if file_id else None
     
-    # 1. ניסיון משיכת נתונים מהדרייב
-    if _svc and file_id:
+    # 1. ניסיון משיכת נתונים מהדרייב (או מגרסה שסונכרנה ועדיין ממתינה בתור ההעלאות)
+    if file_id and (_svc or staged is not None):
         try:
-            req = _svc.files().get_media(fileId=file_id)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, req)
-            done = False
-            while not done:
-                _, done = downloader.next_chunk()
-            fh.seek(0)
+            if staged is not None:
+                fh = io.BytesIO(staged)
+            else:
+                req = _svc.files().get_media(fileId=file_id)
+                fh = io.BytesIO()
+                downloader = MediaIoBaseDownload(fh, req)
+                done = False
+                while not done:
+                    _, done = downloader.next_chunk()
+                fh.seek(0)
             df_drive = pd.read_excel(fh)
             
             if 'student_name' not in df_drive.columns:
@@ -125,12 +161,12 @@ def load_full_dataset(_svc):
 
     # 2. ניסיון משיכת נתונים מהמכשיר המקומי
     df_local = pd.DataFrame()
-    if os.path.exists(DATA_FILE):
+    if os.path.exists(data_file):
         try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
+            with open(data_file, "r", encoding="utf-8") as f:
                 df_local = pd.DataFrame([json.loads(l) for l in f if l.strip()])
         except Exception as e:
-            st.error(f"❌ שגיאה בקריאת הנתונים המקומיים (reflections.jsonl): {e}")
+            st.error(f"❌ שגיאה בקריאת הנתונים המקומיים ({data_file}): {e}")
 
     # 3. איחוד וניקוי כפילויות
     df = pd.concat([df_drive, df_local], ignore_index=True)
@@ -140,21 +176,33 @@ def load_full_dataset(_svc):
         if 'timestamp' in df.columns:
             df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
         
-        # ניקוי כפילויות (השיפור של Copilot)
-        df = df.drop_duplicates(subset=['student_name', 'timestamp'], keep='last')
+        # ניקוי כפילויות (השיפור של Copilot); שורות מיובאות בלי חותמת זמן נבדלות לפי import_key
+        df = df.drop_duplicates(subset=['student_name', 'timestamp'] + (['import_key'] if 'import_key' in df.columns else []), keep='last')
         
-        # סידור שמות
+        # סידור שמות וזיהוי תלמידים (מפתח קנוני + student_id משותף לכל המקורות)
         if 'student_name' in df.columns:
             df['student_name'] = df['student_name'].astype(str).str.strip()
-            df['name_clean'] = df['student_name'].apply(normalize_name)
+            add_student_ids(df, 'student_name', get_identity(part["identity_file"]), register=True)
     
+    # סיכום קטן לכל כיתה - ממנו נבנית התצוגה המצטברת בלי לטעון את שאר הכיתות
+    write_summary(part, partition_summary(df))
     return df
     
-def call_gemini(prompt, audio_bytes=None):
+def call_gemini(prompt, audio_bytes=None, priority=REFLECTION):
+    """כל הקריאות לג'ימיני עוברות דרך המתזמן המשותף (מכסה ועדיפויות בין כל הסשנים)"""
+    api_key = st.secrets.get("GOOGLE_API_KEY")
+    if not api_key: return "שגיאה: חסר API Key"
+    try:
+        return get_scheduler().run(lambda: _post_gemini(api_key, prompt, audio_bytes), priority)
+    except SchedulerBusyError as e:
+        return f"שגיאה: המערכת עמוסה כרגע - {e}. נסה שוב בעוד דקה."
+    except DeadlineExceededError as e:
+        return f"שגיאה: {e}. נסה שוב בעוד דקה."
+    except RateLimitedError:
+        return "שגיאת API (429): חריגה ממכסת הבקשות. נסה שוב בעוד דקה."
+
+def _post_gemini(api_key, prompt, audio_bytes=None):
     try:
-        api_key = st.secrets.get("GOOGLE_API_KEY")
-        if not api_key: return "שגיאה: חסר API Key"
-
         model_id = "gemini-2.5-flash" 
         url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_id}:generateContent?key={api_key}"
         
@@ -178,6 +226,8 @@ def call_gemini(prompt, audio_bytes=None):
         response = requests.post(url, headers=headers, json=payload, timeout=90)
         res_json = response.json()
 
+        if response.status_code == 429:
+            raise RateLimitedError(res_json.get('error', {}).get('message', ''))
         if response.status_code != 200:
             return f"שגיאת API ({response.status_code}): {res_json.get('error', {}).get('message', 'Unknown error')}"
 
@@ -187,6 +237,8 @@ def call_gemini(prompt, audio_bytes=None):
         
         return candidates[0].get('content', {}).get('parts', [{}])[0].get('text', 'לא התקבל טקסט מהמודל.')
 
+    except RateLimitedError:
+        raise
     except Exception as e:
         return f"שגיאה טכנית: {str(e)}"
         
@@ -198,7 +250,7 @@ def get_ai_model():
         return None
     import google.generativeai as genai
     genai.configure(api_key=api_key)
-    return genai.GenerativeModel('gemini-2.5-flash')        
+    return GovernedClient(genai.GenerativeModel('gemini-2.5-flash'), BATCH)
 
 # ==========================================
 # --- 2. פונקציות ממשק משתמש (Tabs) ---
@@ -217,16 +269,23 @@ def validate_entry(entry):
         return False
     return True
 
-def render_tab_entry(svc, full_df):
+def partition_folder(part, key):
+    """תיקיית הדרייב של הכיתה. אם לא הוגדרה - שגיאה ברורה, ולא העלאה לתיקייה של כיתה אחרת"""
+    folder = part.get(key)
+    if not folder:
+        st.error(f"⚠️ חסר {key} עבור {part['label']} ב-Secrets של Streamlit - ההעלאה בוטלה.")
+    return folder
+
+def render_tab_entry(svc, full_df, part):
     it = st.session_state.it
     
     # 1. בחירת סטודנט - מחוץ לעמודות (לכל רוחב המסך)
-    student_name = st.selectbox("👤 בחר סטודנט", CLASS_ROSTER, key=f"sel_{it}")
+    student_name = st.selectbox("👤 בחר סטודנט", part["roster"], key=f"sel_{part['id']}_{it}")
     
     # 2. לוגיקה של הפס הירוק
     if student_name != st.session_state.last_selected_student:
-        target = normalize_name(student_name)
-        match = full_df[full_df['name_clean'] == target] if not full_df.empty else pd.DataFrame()
+        sid = get_identity(part["identity_file"]).resolve(pd.Series([student_name])).iat[0]
+        match = full_df[full_df['student_id'] == sid] if not full_df.empty and pd.notna(sid) else pd.DataFrame()
         st.session_state.show_success_bar = not match.empty
         st.session_state.student_context = match.tail(15).to_string() if not match.empty else ""
         st.session_state.last_selected_student = student_name
@@ -333,18 +392,20 @@ def render_tab_entry(svc, full_df):
                 
                 if validate_entry(entry):
                     if final_ch or final_ins or up_files:
-                        with st.spinner("שומר לאקסל ומעלה קבצים..."):
+                        with st.spinner("שומר תצפית ומכין תמונות להעלאה..."):
+                            queue = get_upload_queue()
                             img_links = []
                             if up_files:
-                                for f in up_files:
-                                    link = drive_upload_file(svc, f, GDRIVE_FOLDER_ID)
-                                    if link:
-                                        img_links.append(link)
+                                folder = partition_folder(part, "gdrive_folder_id")
+                                if not folder: st.stop()
+                                try:
+                                    img_links = stage_images(up_files, folder, get_image_index(), queue, backfill=[part["data_file"]])
+                                except QueueFullError as e:
+                                    st.error(f"❌ {e}")
+                                    st.stop()
                             
                             entry["images"] = ", ".join(img_links)
-                            
-                            with open(DATA_FILE, "a", encoding="utf-8") as f:
-                                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                            queue.save_entry(part["data_file"], entry)
                             
                             st.balloons()
                             st.success("✅ התצפית והרפלקציה המחקרית נשמרו בהצלחה!")
@@ -373,46 +434,97 @@ def render_tab_entry(svc, full_df):
         
         u_q = st.chat_input("שאל על הסטודנט...")
         if u_q:
-            resp = call_gemini(f"היסטוריה: {st.session_state.student_context}. שאלה: {u_q}")
+            resp = call_gemini(f"היסטוריה: {st.session_state.student_context}. שאלה: {u_q}", priority=INTERACTIVE)
             st.session_state.chat_history.append((u_q, resp))
             st.rerun()
 
-def render_tab_sync(svc, full_df):
+def render_tab_sync(svc, full_df, part):
     st.header("🔄 סנכרון לדרייב")
-    file_id = st.secrets.get("MASTER_FILE_ID")
+    file_id = part["master_file_id"]
+    data_file = part["data_file"]
     
-    if os.path.exists(DATA_FILE) and st.button("🚀 סנכרן לקובץ המרכזי"):
+    if os.path.exists(data_file) and st.button("🚀 סנכרן לקובץ המרכזי"):
         if not file_id:
-            st.error("⚠️ חסר MASTER_FILE_ID בתוך ה-Secrets של Streamlit!")
+            st.error(f"⚠️ חסר מזהה קובץ מאסטר (MASTER_FILE_ID / master_file_id) עבור {part['label']} ב-Secrets של Streamlit!")
+            return
+        if not get_upload_queue().has_backend:
+            # בלי חיבור לדרייב התור לא מתרוקן - הנתונים המקומיים נשארים עד שהחיבור יוגדר
+            st.error("⚠️ אין חיבור לגוגל דרייב (GDRIVE_SERVICE_ACCOUNT_B64) - הסנכרון בוטל והנתונים נשמרו מקומית.")
             return
 
         try:
-            with st.spinner("מתחבר לקובץ המאסטר וממזג נתונים..."):
-                with open(DATA_FILE, "r", encoding="utf-8") as f:
-                    locals_ = [json.loads(l) for l in f if l.strip()]
+            with st.spinner("ממזג נתונים ומכניס את קובץ המאסטר לתור ההעלאות..."), DATA_LOCK:
+                queue = get_upload_queue()
+                with open(data_file, "r", encoding="utf-8") as f:
+                    text = queue.resolve_text(f.read())
+                if PENDING_PREFIX in text:
+                    st.warning("⏳ חלק מהתמונות/ההקלטות עדיין ממתינות להעלאה לדרייב. נסה לסנכרן שוב בעוד רגע.")
+                    return
+                locals_ = [json.loads(l) for l in text.splitlines() if l.strip()]
                 
                 df_new = pd.DataFrame(locals_)
                 df_combined = pd.concat([full_df, df_new], ignore_index=True)
-                df_combined = df_combined.drop_duplicates(subset=['student_name', 'timestamp'], keep='last')
+                df_combined = df_combined.drop_duplicates(subset=['student_name', 'timestamp'] + (['import_key'] if 'import_key' in df_combined.columns else []), keep='last')
                 
                 buf = io.BytesIO()
                 with pd.ExcelWriter(buf, engine='openpyxl') as w:
                     df_combined.to_excel(w, index=False)
-                buf.seek(0)
                 
-                media = MediaIoBaseUpload(buf, mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-                svc.files().update(fileId=file_id, media_body=media, supportsAllDrives=True).execute()
+                # timeout=0: בזמן שמחזיקים את DATA_LOCK ה-uploader לא יכול להתקדם, אז לא ממתינים לפינוי מקום
+                queue.enqueue(buf.getvalue(), MASTER_FILENAME, XLSX_MIME, file_id=file_id, timeout=0)
                 
-                os.remove(DATA_FILE)
-                st.success("✅ הנתונים סונכרנו בהצלחה לקובץ המאסטר הראשי!")
+                os.remove(data_file)
+                st.success("✅ הנתונים מוזגו! קובץ המאסטר יתעדכן בדרייב ברקע.")
                 st.cache_data.clear()
                 st.rerun()
         except Exception as e:
             st.error(f"❌ שגיאת סנכרון: {e}")
 
-def render_tab_analysis(svc):
+    st.markdown("---")
+    with st.expander("🪪 כינויים ושגיאות כתיב בשמות תלמידים"):
+        resolver = get_identity(part["identity_file"])
+        st.caption("שם שמופיע אחרת באחד המקורות (מאסטר, תצפיות, שאלונים) ימופה לאותו תלמיד.")
+        c_alias, c_canon = st.columns(2)
+        with c_alias: alias = st.text_input("שם כפי שמופיע בקובץ:", key=f"alias_in_{part['id']}")
+        with c_canon: canon = st.selectbox("שייך לתלמיד:", [r for r in part["roster"] if r != "תלמיד אחר..."], key=f"alias_to_{part['id']}")
+        if alias and st.button("➕ הוסף כינוי", key=f"alias_btn_{part['id']}"):
+            resolver.add_alias(alias, canon)
+            st.cache_data.clear()
+            st.success(f"✅ '{alias}' ימופה מעכשיו ל-{canon}")
+        if resolver.aliases:
+            st.dataframe(pd.DataFrame(list(resolver.aliases.items()), columns=["כינוי", "מפתח תלמיד"]), use_container_width=True)
+
+    st.markdown("---")
+    st.subheader("📥 ייבוא מרוכז של תצפיות")
+    bulk_file = st.file_uploader("קובץ CSV / XLSX / JSONL במבנה של קובץ התצפיות או המאסטר:", type=["csv", "xlsx", "jsonl"], key=f"bulk_up_{part['id']}")
+    if bulk_file and st.button("📥 ייבא לקובץ המקומי", key=f"bulk_btn_{part['id']}"):
+        prog = st.empty()
+        try:
+            resolver = get_identity(part["identity_file"])
+            report, rejects = import_stream(bulk_file, part["data_file"], existing_keys(full_df, resolver),
+                                            on_progress=lambda r: prog.caption(f"נקראו {r['read']} שורות | יובאו {r['imported']}"),
+                                            resolver=resolver)
+        except Exception as e:
+            st.error(f"❌ שגיאה בקריאת הקובץ {bulk_file.name}: {e}")
+            return
+        st.success(f"✅ יובאו {report['imported']} תצפיות מתוך {report['read']} שורות ({report['duplicates']} כפילויות דולגו).")
+        if not rejects.empty:
+            st.warning(f"⚠️ {report['rejected']} שורות נדחו:")
+            st.dataframe(rejects, use_container_width=True)
+            st.download_button("⬇️ הורד את השורות שנדחו", rejects.to_csv(index=False).encode("utf-8-sig"), "rejects.csv", "text/csv")
+        st.cache_data.clear()
+
+def render_tab_analysis(svc, part):
     st.header("📊 מרכז ניתוח ומגמות")
-    df_v = load_full_dataset(svc)
+    df_v = load_full_dataset(svc, part["id"])
+    
+    if len(PARTITIONS) > 1:
+        with st.expander("🏫 תצוגה מצטברת לכל הכיתות"):
+            agg = aggregate_view(PARTITIONS)
+            if agg.empty: st.info("עדיין לא נטענה אף כיתה.")
+            else:
+                st.dataframe(agg, use_container_width=True)
+                st.caption("מבוסס על סיכומי כל כיתה מהטעינה האחרונה שלה (ולא על השורות הגולמיות).")
     
     if df_v.empty:
         st.info("אין עדיין מספיק נתונים לניתוח. בצע סנכרון בטאב 2 או הזן תצפיות חדשות.")
@@ -420,6 +532,8 @@ def render_tab_analysis(svc):
 
     df_v['date'] = pd.to_datetime(df_v['date'], errors='coerce')
     df_v['week'] = df_v['date'].dt.strftime('%Y - שבוע %U')
+    # מנוע הצמיחה משותף לכל הסשנים ומוסיף רק תצפיות חדשות מאז העדכון הקודם
+    growth = get_engine(part["id"]).update(df_v)
     
     st.subheader("📈 מעקב התקדמות אישי")
     all_students = sorted(df_v['student_name'].dropna().unique())
@@ -445,6 +559,16 @@ def render_tab_analysis(svc):
             st.line_chart(plot_df)
             st.caption("מגמת שינוי במדדים הכמותיים (1-5)")
             
+            sid = student_data['student_id'].dropna()
+            g = growth.slopes()
+            g = g[g['student_id'] == int(sid.iloc[0])].set_index('metric') if not sid.empty else g.iloc[0:0]
+            trend_metrics = [c for c in available_metrics if c in g.index]
+            if trend_metrics:
+                cols = st.columns(len(trend_metrics))
+                for col, c in zip(cols, trend_metrics):
+                    col.metric(metrics[c], f"{g.loc[c, 'slope']:+.2f}", help=f"שינוי משוער בציון לחודש (n={g.loc[c, 'n']})")
+                st.caption("שיפוע צמיחה: שינוי ממוצע בציון לחודש לאורך הסמסטר (ריבועים פחותים)")
+            
             missing = [metrics[c] for c in metrics.keys() if c not in student_data.columns]
             if missing:
                 st.info(f"💡 הערה: המדדים הבאים טרם תועדו עבור תלמיד זה: {', '.join(missing)}")
@@ -453,6 +577,19 @@ def render_tab_analysis(svc):
     else:
         st.warning("אין מספיק נתונים להצגת גרף עבור תלמיד זה.")
 
+    with st.expander("📐 מודל צמיחה כיתתי"):
+        st.write("שיפועי צמיחה לפי מדד (שינוי בציון לחודש):")
+        st.dataframe(growth.class_summary(), use_container_width=True)
+        st.write("עבודה בעזרת גוף מודפס מול ללא גוף:")
+        st.dataframe(growth.method_contrast(), use_container_width=True)
+        mm_metric = st.selectbox("מדד למודל רב-רמתי (Mixed Effects):", growth.metrics, key=f"mm_metric_{part['id']}")
+        if st.button("🧮 הרץ מודל רב-רמתי", key=f"mm_btn_{part['id']}"):
+            with st.spinner("מתאים מודל רב-רמתי..."):
+                res = growth.mixed_model(mm_metric)
+            if res is None: st.info("אין מספיק נתונים (נדרשים לפחות 3 תלמידים ו-10 תצפיות).")
+            elif "error" in res: st.error(res["error"])
+            else: st.json(res)
+
     st.markdown("---")
     st.subheader("🧠 ניתוח תמות שבועי (AI)")
     weeks = sorted(df_v['week'].dropna().unique(), reverse=True)
@@ -470,21 +607,23 @@ def render_tab_analysis(svc):
         if st.button("✨ הפק ניתוח שבועי ושמור לדרייב"):
             with st.spinner("ג'ימיני מנתח את התצפיות..."):
                 txt = "".join([f"תלמיד: {r.get('student_name','')} | קושי: {r.get('challenge','')} | תובנה: {r.get('insight','')}\n" for _, r in w_df.iterrows()])
-                response = call_gemini(f"בצע ניתוח תמות אקדמי על התצפיות הבאות עבור שבוע {sel_w}:\n\n{txt}")
+                response = call_gemini(f"בצע ניתוח תמות אקדמי על התצפיות הבאות עבור שבוע {sel_w}:\n\n{txt}", priority=BATCH)
                 st.markdown(f'<div class="feedback-box"><b>📊 ממצאים לשבוע {sel_w}:</b><br>{response}</div>', unsafe_allow_html=True)
                 
-                try:
-                    f_name = f"ניתוח_תמות_{sel_w.replace(' ', '_')}.txt"
-                    drive_upload_bytes(svc, response, f_name, GDRIVE_FOLDER_ID, is_text=True)
-                    st.success(f"הניתוח נשמר בדרייב.")
-                except Exception as e:
-                    st.error(f"הניתוח הופק אך נכשלה השמירה: {e}")
-
-def render_tab_interview(svc, full_df):
+                folder = partition_folder(part, "gdrive_folder_id")
+                if folder:
+                    try:
+                        f_name = f"ניתוח_תמות_{sel_w.replace(' ', '_')}.txt"
+                        get_upload_queue().enqueue_text(response, f_name, folder)
+                        st.success(f"הניתוח נשמר ויועלה לדרייב ברקע.")
+                    except Exception as e:
+                        st.error(f"הניתוח הופק אך נכשלה השמירה: {e}")
+
+def render_tab_interview(svc, full_df, part):
     it = st.session_state.it
     st.subheader("🎙️ ראיון עומק וניתוח תמות הנדסי משודרג")
     
-    student_name = st.selectbox("בחר סטודנט לראיון:", CLASS_ROSTER, key=f"int_sel_{it}")
+    student_name = st.selectbox("בחר סטודנט לראיון:", part["roster"], key=f"int_sel_{part['id']}_{it}")
     audio_data = mic_recorder(start_prompt="התחל הקלטה ⏺️", stop_prompt="עצור ונתח ⏹️", key=f"mic_int_{it}")
     
     if audio_data:
@@ -522,15 +661,17 @@ def render_tab_interview(svc, full_df):
         
         if st.button("💾 שמור וסנכרן לתיקיית המחקר ולאקסל", type="primary", key=f"save_int_{it}"):
             saved_audio = st.session_state.get(f"audio_bytes_{it}")
+            folder = partition_folder(part, "interview_folder_id")
             if not saved_audio:
                 st.error("ההקלטה אבדה. אנא הקלט שוב.")
-            else:
+            elif folder:
                 prog_bar = st.progress(0)
                 try:
                     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    a_link = drive_upload_bytes(svc, saved_audio, f"Int_{student_name}_{ts}.wav", INTERVIEW_FOLDER_ID)
+                    queue = get_upload_queue()
+                    a_link = queue.enqueue(saved_audio, f"Int_{student_name}_{ts}.wav", "audio/wav", folder, backfill=[part["data_file"]])
                     prog_bar.progress(50)
-                    t_link = drive_upload_bytes(svc, st.session_state[analysis_key], f"An_{student_name}_{ts}.txt", INTERVIEW_FOLDER_ID, is_text=True)
+                    t_link = queue.enqueue_text(st.session_state[analysis_key], f"An_{student_name}_{ts}.txt", folder, backfill=[part["data_file"]])
                     
                     entry = {
                         "type": "interview_analysis", 
@@ -540,8 +681,7 @@ def render_tab_interview(svc, full_df):
                         "analysis_link": t_link,
                         "timestamp": datetime.now().isoformat()
                     }
-                    with open(DATA_FILE, "a", encoding="utf-8") as f:
-                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    queue.save_entry(part["data_file"], entry)
                     
                     prog_bar.progress(100)
                     st.success(f"✅ הראיון של {student_name} נשמר וסונכרן!")
@@ -554,54 +694,17 @@ def render_tab_interview(svc, full_df):
                 except Exception as e:
                     st.error(f"שגיאה בשמירה: {e}")
 
-def drive_upload_file(svc, file_obj, folder_id):
-    try:
-        file_content = file_obj.read()
-        file_obj.seek(0) 
-        media = MediaIoBaseUpload(io.BytesIO(file_content), mimetype=file_obj.type, resumable=True)
-        file_metadata = {'name': file_obj.name, 'parents': [folder_id]}
-        
-        result = svc.files().create(
-            body=file_metadata, 
-            media_body=media, 
-            fields='id, webViewLink', 
-            supportsAllDrives=True
-        ).execute()
-        return result.get('webViewLink', '')
-    except Exception as e:
-        st.error(f"❌ העלאת התמונה '{file_obj.name}' נכשלה.")
-        st.exception(e) 
-        return ""
-
-def drive_upload_bytes(svc, content, filename, folder_id, is_text=False):
-    try:
-        mime = 'text/plain' if is_text else 'audio/wav'
-        if is_text and isinstance(content, str):
-            content = content.encode('utf-8')
-        
-        media = MediaIoBaseUpload(io.BytesIO(content), mimetype=mime, resumable=True)
-        file_metadata = {'name': filename, 'parents': [folder_id] if folder_id else []}
-        
-        f = svc.files().create(
-            body=file_metadata, 
-            media_body=media, 
-            fields='id, webViewLink', 
-            supportsAllDrives=True
-        ).execute()
-        return f.get('webViewLink')
-    except Exception as e:
-        type_str = "הניתוח" if is_text else "הקלטת האודיו"
-        st.error(f"❌ תקלה קריטית: {type_str} לא נשמר בדרייב!")
-        st.exception(e)
-        return "שגיאת העלאה"
-        
 # ==========================================
 # --- 3. גוף הקוד הראשי (Main) ---
 # ==========================================
 
+# בחירת כיתה/מחזור - רק הנתונים שלה נטענים
+part_id = st.sidebar.selectbox("🏫 כיתה / מחזור", list(PARTITIONS), format_func=lambda p: PARTITIONS[p]["label"], key="partition_id")
+part = PARTITIONS[part_id]
+
 # אתחול שירותים ונתונים
 svc = get_drive_service()
-full_df = load_full_dataset(svc)
+full_df = load_full_dataset(svc, part_id)
 
 # אתחול ה-Session State
 if "it" not in st.session_state: st.session_state.it = 0
@@ -609,18 +712,23 @@ if "last_selected_student" not in st.session_state: st.session_state.last_select
 if "show_success_bar" not in st.session_state: st.session_state.show_success_bar = False
 if "last_feedback" not in st.session_state: st.session_state.last_feedback = ""
 if "chat_history" not in st.session_state: st.session_state.chat_history = []
+if st.session_state.get("active_partition") != part_id:
+    # מעבר כיתה מאפס את ההקשר של התלמיד הקודם
+    st.session_state.active_partition = part_id
+    st.session_state.last_selected_student = ""
+    st.session_state.chat_history = []
 
 # יצירת הטאבים בממשק
 tab1, tab2, tab3, tab4, tab5 = st.tabs(["📝 הזנה ומשוב", "🔄 סנכרון", "📊 ניתוח", "🎙️ ראיון עומק", "🤖 סוכן סטטיסטי"])
 
 with tab1: 
-    render_tab_entry(svc, full_df)
+    render_tab_entry(svc, full_df, part)
 with tab2: 
-    render_tab_sync(svc, full_df)
+    render_tab_sync(svc, full_df, part)
 with tab3: 
-    render_tab_analysis(svc)
+    render_tab_analysis(svc, part)
 with tab4: 
-    render_tab_interview(svc, full_df)
+    render_tab_interview(svc, full_df, part)
 with tab5:
     render_ai_agent_tab() # <-- התיקון הקריטי: קריאה ללא העברת full_df
 
@@ -630,6 +738,20 @@ if st.sidebar.button("🔄 רענן נתונים"):
     st.cache_data.clear()
     st.rerun()
 
+@st.fragment(run_every=5)
+def render_gemini_load():
+    stats = get_scheduler().stats()
+    st.caption(f"🤖 עומס ג'ימיני (בתהליך: {stats['in_flight']})")
+    for p, label in PRIORITY_LABELS.items():
+        st.caption(f"{label}: {stats[p]['depth']} בתור | המתנה ממוצעת {stats[p]['avg_wait']} שנ'")
+
 st.sidebar.markdown("---")
+with st.sidebar:
+    render_gemini_load()
 st.sidebar.write(f"מצב חיבור דרייב: {'✅' if svc else '❌'}")
+q_stats = get_upload_queue().stats()
+st.sidebar.caption(f"📤 ממתינים להעלאה: {q_stats['pending']} ({q_stats['staged_mb']}MB) | נכשלו: {q_stats['failed']}")
+if q_stats['failed'] and st.sidebar.button("🔁 נסה שוב העלאות שנכשלו"):
+    get_upload_queue().retry_failed()
+    st.rerun()
 st.sidebar.caption(f"גרסת מערכת: 54.0 | {date.today()}")
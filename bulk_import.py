@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import pandas as pd
+from ai_engine import SCORE_COLS, CAT_COLS
+from identity import OTHER_NAME, IdentityResolver, normalize_names, get_identity
+from local_store import append_lines
+from partitions import DEFAULT_PARTITION, partition_data_file, partition_identity_file
+
+CHUNK_ROWS  = 2000
+RANGE_COLS  = SCORE_COLS + CAT_COLS + ["difficulty"]   # כולם בסולם 1-5
+TEXT_COLS   = ["challenge", "insight", "done", "planned", "lesson_id"]
+NAME_ALIASES = ["student", "name", "שם", "תלמיד"]
+
+def _format(src) -> str:
+    name = src if isinstance(src, str) else getattr(src, "name", "")
+    ext = os.path.splitext(name)[1].lower()
+    return {".xlsx": "xlsx", ".jsonl": "jsonl", ".json": "jsonl"}.get(ext, "csv")
+
+def iter_chunks(src, chunksize: int = CHUNK_ROWS):
+    """קורא CSV / XLSX / JSONL בחלקים, בלי לטעון את כל הקובץ לזיכרון"""
+    fmt = _format(src)
+    if fmt == "csv":
+        yield from pd.read_csv(src, chunksize=chunksize)
+    elif fmt == "jsonl":
+        yield from pd.read_json(src, lines=True, chunksize=chunksize, dtype=False, convert_dates=False)
+    else:
+        from openpyxl import load_workbook
+        wb = load_workbook(src, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(h) if h is not None else f"col_{i}" for i, h in enumerate(next(rows, []))]
+        buf = []
+        for row in rows:
+            buf.append(row)
+            if len(buf) >= chunksize:
+                yield pd.DataFrame(buf, columns=header)
+                buf = []
+        if buf: yield pd.DataFrame(buf, columns=header)
+        wb.close()
+
+def _parse_times(s: pd.Series) -> pd.Series:
+    """פענוח חותמות זמן מכל מקור (טקסט, תאי תאריך של אקסל, עם/בלי אזור זמן) לזמן נאיבי ב-UTC"""
+    return pd.to_datetime(s, errors="coerce", format="mixed", utc=True).dt.tz_localize(None)
+
+def _dedup_ts(ts: pd.Series) -> pd.Series:
+    # הקיטום לשניות הוא רק למפתח הכפילות; השורה עצמה נשמרת בדיוק המקורי
+    return ts.dt.strftime("%Y-%m-%dT%H:%M:%S")
+
+def _name_keys(names: pd.Series, resolver: IdentityResolver | None) -> pd.Series:
+    return resolver.canonical_keys(names) if resolver else normalize_names(names)
+
+def _row_keys(name_keys: pd.Series, ts: pd.Series, date: pd.Series, import_key: pd.Series) -> pd.Series:
+    # חותמת זמן (עד השנייה) אם יש; אחרת תאריך + טביעת התוכן (import_key)
+    return name_keys + "|" + _dedup_ts(ts).fillna(date.dt.strftime("%Y-%m-%d") + "#" + import_key).fillna("")
+
+def _col(df: pd.DataFrame, name: str) -> pd.Series:
+    return df[name] if name in df.columns else pd.Series(pd.NA, index=df.index, dtype="object")
+
+def existing_keys(df: pd.DataFrame, resolver: IdentityResolver | None = None) -> set[str]:
+    """מפתחות הכפילות (מפתח תלמיד קנוני + חותמת זמן או תאריך וטביעת תוכן) של נתונים שכבר קיימים"""
+    if df.empty or "student_name" not in df.columns: return set()
+    keys = _row_keys(_name_keys(df["student_name"], resolver), _parse_times(_col(df, "timestamp")),
+                     _parse_times(_col(df, "date")), _col(df, "import_key").astype("string"))
+    return set(keys.tolist())
+
+def validate_chunk(df: pd.DataFrame, first_row: int = 1, resolver: IdentityResolver | None = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """בדיקה ונרמול וקטוריים של חלק שלם. מחזיר (שורות תקינות, דחיות עם מספר שורה וסיבה)"""
+    df = df.copy()
+    df.index = pd.RangeIndex(first_row, first_row + len(df))
+    if "student_name" not in df.columns:
+        cols = [c for c in df.columns if any(x in str(c).lower() for x in NAME_ALIASES)]
+        df = df.rename(columns={cols[0]: "student_name"}) if cols else df.assign(student_name=pd.NA)
+    reasons = pd.Series("", index=df.index, dtype="string")
+
+    def _reject(mask, reason):
+        nonlocal reasons
+        reasons = reasons.mask(mask, reasons + reason + "; ")
+
+    df["student_name"] = df["student_name"].astype("string").str.strip()
+    df["name_key"] = _name_keys(df["student_name"], resolver)
+    _reject((df["name_key"] == "") | (df["student_name"] == OTHER_NAME), "חסר שם תלמיד")
+
+    for c in RANGE_COLS:
+        if c not in df.columns: continue
+        num = pd.to_numeric(df[c], errors="coerce")
+        _reject(df[c].notna() & ~num.between(1, 5), f"{c} מחוץ לטווח 1-5")
+        df[c] = num
+    if "duration_min" in df.columns:
+        dur = pd.to_numeric(df["duration_min"], errors="coerce")
+        _reject(df["duration_min"].notna() & ~(dur > 0), "זמן עבודה חייב להיות גדול מ-0")
+        df["duration_min"] = dur
+
+    raw_date = _col(df, "date")
+    raw_ts = _col(df, "timestamp")
+    date = _parse_times(raw_date)
+    ts = _parse_times(raw_ts)
+    _reject(raw_date.notna() & date.isna(), "תאריך לא תקין")
+    _reject(raw_ts.notna() & ts.isna(), "חותמת זמן לא תקינה")
+    date = date.fillna(ts.dt.normalize())
+    _reject(date.isna() & raw_date.isna(), "חסר תאריך")
+
+    # בלי חותמת זמן לא ממציאים שעה: timestamp נשאר ריק, ובמקומו נשמרת טביעת התוכן import_key,
+    # כך שייבוא חוזר של אותה שורה יזוהה ככפילות ושתי תצפיות שונות באותו יום לא יתמזגו ב-drop_duplicates
+    content = df[["name_key"] + [c for c in TEXT_COLS if c in df.columns]].astype("string").fillna("")
+    digest = pd.Series(pd.util.hash_pandas_object(content, index=False).to_numpy().astype(str), index=df.index, dtype="string")
+    df["import_key"] = digest.where(ts.isna())
+
+    df["date"] = date.dt.strftime("%Y-%m-%d")
+    if pd.api.types.infer_dtype(raw_ts, skipna=True) == "string":
+        df["timestamp"] = raw_ts.where(ts.notna())   # טקסט (CSV/JSONL) - נשמר כמו שהוא
+    else:
+        # תאי תאריך של אקסל - ISO, עם מיקרו-שניות רק כשיש
+        df["timestamp"] = ts.dt.strftime("%Y-%m-%dT%H:%M:%S.%f").where(ts.dt.microsecond != 0, _dedup_ts(ts))
+    df["dedup_key"] = _row_keys(df["name_key"], ts, date, df["import_key"])
+    bad = reasons != ""
+    rejects = pd.DataFrame({"row": df.index[bad], "student_name": df.loc[bad, "student_name"],
+                            "reason": reasons[bad].str.rstrip("; ")})
+    return df[~bad], rejects
+
+def import_stream(src, data_file: str, known_keys: set[str], chunksize: int = CHUNK_ROWS, on_progress=None,
+                  resolver: IdentityResolver | None = None) -> tuple[dict, pd.DataFrame]:
+    """מייבא קובץ גדול לקובץ התצפיות המקומי: כתיבה אחת לכל חלק. known_keys מתעדכן במקום"""
+    report = {"read": 0, "imported": 0, "duplicates": 0, "rejected": 0}
+    all_rejects = []
+    for chunk in iter_chunks(src, chunksize):
+        valid, rejects = validate_chunk(chunk, first_row=report["read"] + 1, resolver=resolver)
+        report["read"] += len(chunk)
+        keys = valid["dedup_key"]
+        dup = keys.isin(known_keys) | keys.duplicated()
+        valid = valid[~dup]
+        known_keys.update(keys[~dup])
+
+        out = valid.drop(columns=["name_key", "dedup_key"])
+        lines = [json.dumps({k: v for k, v in rec.items() if v is not None}, ensure_ascii=False, default=str)
+                 for rec in out.astype(object).where(out.notna(), None).to_dict(orient="records")]
+        append_lines(data_file, lines)
+
+        report["imported"] += len(valid)
+        report["duplicates"] += int(dup.sum())
+        report["rejected"] += len(rejects)
+        all_rejects.append(rejects)
+        if on_progress: on_progress(report)
+    rejects = pd.concat(all_rejects, ignore_index=True) if all_rejects else pd.DataFrame(columns=["row", "student_name", "reason"])
+    return report, rejects
+
+def main():
+    parser = argparse.ArgumentParser(description="ייבוא מרוכז של תצפיות (CSV / XLSX / JSONL) לקובץ התצפיות המקומי")
+    parser.add_argument("source")
+    parser.add_argument("--partition", help="מזהה כיתה/מחזור (ברירת מחדל: הכיתה הראשית)")
+    parser.add_argument("--data-file", help="ברירת מחדל: קובץ התצפיות של הכיתה")
+    parser.add_argument("--master", action="append", default=[], help="קובץ מאסטר מקומי לבדיקת כפילויות (אפשר כמה)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--rejects", help="נתיב CSV לשמירת השורות שנדחו")
+    args = parser.parse_args()
+
+    data_file = args.data_file or partition_data_file(args.partition or DEFAULT_PARTITION)
+    os.makedirs(os.path.dirname(data_file) or ".", exist_ok=True)
+    resolver = get_identity(partition_identity_file(args.partition or DEFAULT_PARTITION))
+    known = set()
+    for path in [data_file] + args.master:
+        if os.path.exists(path):
+            for chunk in iter_chunks(path, args.chunksize): known |= existing_keys(chunk, resolver)
+
+    report, rejects = import_stream(args.source, data_file, known, args.chunksize,
+                                    on_progress=lambda r: print(f"\r{r['read']} שורות נקראו...", end="", flush=True),
+                                    resolver=resolver)
+    print()
+    print(json.dumps(report, ensure_ascii=False))
+    if args.rejects and not rejects.empty:
+        rejects.to_csv(args.rejects, index=False, encoding="utf-8-sig")
+        print(f"השורות שנדחו נשמרו ב-{args.rejects}")
+
+if __name__ == "__main__":
+    main()
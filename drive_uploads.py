@@ -0,0 +1,41 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseUpload
+
+CHUNK_SIZE  = 1024 * 1024   # חייב להיות כפולה של 256KB (דרישת ה-API להעלאה מחולקת)
+MAX_WORKERS = 4
+NUM_RETRIES = 3
+
+_local = threading.local()
+
+def thread_service(creds):
+    # אובייקט השירות של googleapiclient אינו thread-safe, לכן כל thread מחזיק עותק משלו
+    svc = getattr(_local, "svc", None)
+    if svc is None:
+        svc = build("drive", "v3", credentials=creds, cache_discovery=False)
+        _local.svc = svc
+    return svc
+
+def upload_resumable(svc, content: bytes, filename: str, mime: str, folder_id: str | None, file_id: str | None = None) -> str:
+    """העלאה מחולקת. עם file_id - מחליף את תוכן הקובץ הקיים, אחרת יוצר קובץ חדש בתיקייה"""
+    media = MediaIoBaseUpload(io.BytesIO(content), mimetype=mime, chunksize=CHUNK_SIZE, resumable=True)
+    if file_id:
+        req = svc.files().update(fileId=file_id, media_body=media, fields='id, webViewLink', supportsAllDrives=True)
+    else:
+        file_metadata = {'name': filename, 'parents': [folder_id] if folder_id else []}
+        req = svc.files().create(body=file_metadata, media_body=media, fields='id, webViewLink', supportsAllDrives=True)
+    resp = None
+    while resp is None:
+        _, resp = req.next_chunk(num_retries=NUM_RETRIES)
+    return resp.get('webViewLink', '')
+
+def run_concurrent(fn, items: list, max_workers: int = MAX_WORKERS) -> list[tuple[str, Exception | None]]:
+    """מריץ fn על כל פריט במקביל. מחזיר (תוצאה, שגיאה) לכל פריט לפי סדר הקלט"""
+    def _safe(item):
+        try: return fn(item), None
+        except Exception as e: return "", e
+    if not items: return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(_safe, items))
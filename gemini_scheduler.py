@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import streamlit as st
+
+# מחלקות עדיפות - מספר נמוך קודם
+INTERACTIVE, REFLECTION, BATCH = 0, 1, 2
+PRIORITY_LABELS = {INTERACTIVE: "צ'אט יועץ", REFLECTION: "רפלקציה", BATCH: "ניתוח שבועי/אצווה"}
+
+DEFAULT_RPM       = 10                                          # מכסת בקשות לדקה של המפתח
+DEFAULT_BURST     = 3
+QUEUE_LIMITS      = {INTERACTIVE: 20, REFLECTION: 20, BATCH: 5}
+DEFAULT_DEADLINES = {INTERACTIVE: 60, REFLECTION: 120, BATCH: 600}  # שניות המתנה מקסימליות בתור
+WORKERS           = 4
+RATE_LIMIT_PAUSE  = 30                                          # השהיה אחרי 429 מהשרת
+MAX_RETRIES       = 2
+
+class SchedulerBusyError(Exception):
+    pass
+
+class DeadlineExceededError(Exception):
+    pass
+
+class RateLimitedError(Exception):
+    """הפונקציה המתוזמנת זורקת אותה כשהשרת החזיר 429 - המתזמן מאט ומנסה שוב"""
+    pass
+
+class TokenBucket:
+    def __init__(self, rate_per_min: float, burst: int):
+        self.rate = rate_per_min / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def try_acquire(self) -> float:
+        """לוקח אסימון אם יש. אחרת מחזיר כמה שניות לחכות"""
+        now = time.monotonic()
+        if now < self.blocked_until: return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def penalize(self, seconds: float):
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class _Request:
+    def __init__(self, fn, priority, deadline):
+        self.fn = fn
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.retries = 0
+        self.future = Future()
+
+class GeminiScheduler:
+    """מתזמן משותף לכל הסשנים בתהליך: token bucket לפי המכסה, תור חסום לכל מחלקת עדיפות,
+    וביטול בקשות שעבר זמנן לפני שנשלחו."""
+    def __init__(self, rpm: float = DEFAULT_RPM, burst: int = DEFAULT_BURST, workers: int = WORKERS):
+        self.bucket = TokenBucket(rpm, burst)
+        self.queues = {p: deque() for p in PRIORITY_LABELS}
+        self.avg_wait = {p: 0.0 for p in PRIORITY_LABELS}
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"gemini-{i}", daemon=True).start()
+
+    def submit(self, fn, priority: int = REFLECTION, max_wait: float | None = None) -> Future:
+        max_wait = DEFAULT_DEADLINES[priority] if max_wait is None else max_wait
+        req = _Request(fn, priority, time.monotonic() + max_wait)
+        with self._cond:
+            if len(self.queues[priority]) >= QUEUE_LIMITS[priority]:
+                raise SchedulerBusyError(f"יותר מדי בקשות ממתינות ({PRIORITY_LABELS[priority]})")
+            self.queues[priority].append(req)
+            self._cond.notify()
+        return req.future
+
+    def run(self, fn, priority: int = REFLECTION, max_wait: float | None = None, timeout: float | None = None):
+        fut = self.submit(fn, priority, max_wait)
+        try:
+            return fut.result(timeout=timeout)
+        except TimeoutError:
+            fut.cancel()   # אם עוד לא נשלחה - לא תישלח בכלל
+            raise DeadlineExceededError("הבקשה לג'ימיני חרגה מזמן ההמתנה")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {p: {"depth": len(self.queues[p]), "avg_wait": round(self.avg_wait[p], 1)} for p in PRIORITY_LABELS} | {"in_flight": self.in_flight}
+
+    def _next_request(self) -> _Request:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                head = None
+                for p in sorted(self.queues):
+                    q = self.queues[p]
+                    # מנקים מראש התור בקשות שבוטלו או שעבר זמנן
+                    while q and (q[0].future.cancelled() or q[0].deadline < now):
+                        expired = q.popleft()
+                        if not expired.future.cancelled():
+                            expired.future.set_exception(DeadlineExceededError("הבקשה פגה בתור לפני שנשלחה"))
+                    if q and head is None: head = q[0]
+                if head is None:
+                    self._cond.wait()
+                    continue
+                wait = self.bucket.try_acquire()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                self.queues[head.priority].popleft()
+                waited = now - head.enqueued
+                self.avg_wait[head.priority] = 0.8 * self.avg_wait[head.priority] + 0.2 * waited
+                self.in_flight += 1
+                return head
+
+    def _worker(self):
+        while True:
+            req = self._next_request()
+            try:
+                if not req.future.set_running_or_notify_cancel(): continue
+                try:
+                    req.future.set_result(req.fn())
+                except RateLimitedError as e:
+                    with self._cond:
+                        self.bucket.penalize(RATE_LIMIT_PAUSE)
+                        if req.retries < MAX_RETRIES and time.monotonic() + RATE_LIMIT_PAUSE < req.deadline:
+                            # חוזרת לראש התור שלה; ה-Future כבר במצב running ולכן מוחלף בחדש שמקושר לישן
+                            req.retries += 1
+                            retry = _Request(req.fn, req.priority, req.deadline)
+                            retry.retries = req.retries
+                            retry.future.add_done_callback(lambda f, orig=req.future: _chain(f, orig))
+                            self.queues[req.priority].appendleft(retry)
+                            self._cond.notify()
+                        else:
+                            req.future.set_exception(e)
+                except Exception as e:
+                    req.future.set_exception(e)
+            finally:
+                with self._cond: self.in_flight -= 1
+
+def _chain(src: Future, dst: Future):
+    if src.cancelled(): dst.set_exception(DeadlineExceededError("הבקשה בוטלה"))
+    elif src.exception() is not None: dst.set_exception(src.exception())
+    else: dst.set_result(src.result())
+
+def is_rate_limit_error(e: Exception) -> bool:
+    # google.api_core.exceptions.ResourceExhausted (בלי לייבא את החבילה) או כל שגיאה עם קוד 429
+    return type(e).__name__ == "ResourceExhausted" or getattr(e, "code", None) == 429
+
+class GovernedClient:
+    """עוטף אובייקט של google.generativeai (מודל או צ'אט) כך שקריאות הרשת שלו עוברות דרך המתזמן"""
+    NETWORK_METHODS = ("send_message", "generate_content")
+
+    def __init__(self, inner, priority: int):
+        self._inner = inner
+        self._priority = priority
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if name not in self.NETWORK_METHODS: return attr
+        def _call(*args, **kwargs):
+            def _do():
+                try: return attr(*args, **kwargs)
+                except Exception as e:
+                    if is_rate_limit_error(e): raise RateLimitedError(str(e))
+                    raise
+            return get_scheduler().run(_do, self._priority)
+        return _call
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> GeminiScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GeminiScheduler(rpm=float(st.secrets.get("GEMINI_RPM", DEFAULT_RPM)),
+                                         burst=int(st.secrets.get("GEMINI_BURST", DEFAULT_BURST)))
+        return _scheduler
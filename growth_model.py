@@ -0,0 +1,174 @@
+import threading
+import warnings
+import numpy as np
+import pandas as pd
+from ai_engine import SCORE_COLS
+
+T0             = pd.Timestamp("2025-12-01")   # תחילת הסמסטר - ציר הזמן נמדד בחודשים ממנו
+DAYS_PER_MONTH = 30.44
+MIN_OBS        = 2
+MODEL_PATTERN  = "מודפס|בעזרת גוף"             # work_method עם גוף מודפס
+MAX_ENGINES    = 16                             # מעבר לזה המנוע שנוצר ראשון מפונה
+
+class GrowthEngine:
+    """שיפועי צמיחה לכל התלמידים ולכל המדדים בבת אחת, בריבועים פחותים סגורים על סטטיסטיים מצטברים.
+    הסטטיסטיים חיבוריים, ולכן תצפיות חדשות רק מתווספות (בלי התאמה מחדש); אם שורות נמחקו או שונו - בונים מחדש."""
+    # לכל (תלמיד, מדד) נשמרים: n, Σt, Σy, Σt², Σty, Σy²
+    def __init__(self, metrics: list[str] = SCORE_COLS):
+        self.metrics = list(metrics)
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.version = 0
+        self._seen = np.array([], dtype=np.uint64)
+        self._stats = np.zeros((0, len(self.metrics), 6))
+        self._method = np.zeros((2, len(self.metrics), 3))   # [בלי/עם מודל] x מדד x (n, Σy, Σy²)
+        self._rows = self._prepare(pd.DataFrame())   # סכמת העמודות גם כשאין עדיין אף שורה שמישה
+        self._cache = {}
+
+    def update(self, df: pd.DataFrame) -> "GrowthEngine":
+        rows = self._prepare(df)
+        # טביעה לפי זהות השורה (חותמת זמן + אינדקס במקור) יחד עם התוכן - שתי תצפיות זהות באותו יום נספרות פעמיים
+        fp = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+        with self._lock:
+            if not np.isin(self._seen, fp).all(): self.reset()
+            new = ~np.isin(fp, self._seen)
+            if new.any():
+                self._accumulate(rows[new])
+                self._seen = np.concatenate([self._seen, fp[new]])
+                self._rows = pd.concat([self._rows, rows[new]], ignore_index=True)
+                self.version += 1
+                self._cache = {}
+        return self
+
+    def slopes(self) -> pd.DataFrame:
+        """טבלה ארוכה: student_id, metric, n, slope (שינוי בציון לחודש), intercept, se"""
+        with self._lock:
+            if "slopes" in self._cache: return self._cache["slopes"]
+            s = self._stats
+            n, St, Sy, Stt, Sty, Syy = (s[..., k] for k in range(6))
+            den = n * Stt - St ** 2
+            ok = (n >= MIN_OBS) & (den > 1e-9)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                slope = np.where(ok, (n * Sty - St * Sy) / den, np.nan)
+                intercept = np.where(ok, (Sy - slope * St) / n, np.nan)
+                ssr = Syy - intercept * Sy - slope * Sty
+                se = np.sqrt(np.clip(ssr, 0, None) / (n - 2) / (Stt - St ** 2 / n))
+            se = np.where(ok & (n > 2), se, np.nan)
+            sid, mi = np.nonzero(ok)
+            out = pd.DataFrame({
+                "student_id": sid, "metric": np.array(self.metrics)[mi], "n": n[sid, mi].astype(int),
+                "slope": slope[sid, mi], "intercept": intercept[sid, mi], "se": se[sid, mi]
+            })
+            self._cache["slopes"] = out
+            return out
+
+    def class_summary(self) -> pd.DataFrame:
+        """לכל מדד: מספר תלמידים עם מגמה, שיפוע ממוצע/חציוני, ושיעור המשתפרים"""
+        g = self.slopes().groupby("metric")["slope"]
+        return pd.DataFrame({"students": g.size(), "mean_slope": g.mean(), "median_slope": g.median(),
+                             "share_improving": g.apply(lambda v: (v > 0).mean())}).round(3)
+
+    def method_contrast(self) -> pd.DataFrame:
+        """ממוצע וסטיית תקן לכל מדד - עבודה עם גוף מודפס מול בלי"""
+        with self._lock: m = self._method.copy()
+        n, Sy, Syy = m[..., 0], m[..., 1], m[..., 2]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = Sy / n
+            sd = np.sqrt(np.clip((Syy - n * mean ** 2) / (n - 1), 0, None))
+        return pd.DataFrame({
+            "n_without_model": n[0].astype(int), "mean_without_model": mean[0], "sd_without_model": sd[0],
+            "n_with_model": n[1].astype(int), "mean_with_model": mean[1], "sd_with_model": sd[1],
+        }, index=self.metrics).round(2)
+
+    def mixed_model(self, metric: str) -> dict | None:
+        """מודל רב-רמתי כיתתי: score ~ t + with_model, עם חותך ושיפוע אקראיים לכל תלמיד. נשמר לפי גרסת הנתונים.
+        None - אין מספיק נתונים; {"error": ...} - שתי ההתאמות נכשלו"""
+        with self._lock:
+            key = ("mixed", metric, self.version)
+            if key in self._cache: return self._cache[key]
+            data = self._rows[["student_id", "t", "with_model", metric]].rename(columns={metric: "score"})
+        data = data[data["score"].notna()].astype({"student_id": int, "t": float, "score": float})
+        # with_model נכנס רק כשיש תצפיות משתי השיטות, ואז רק שורות ששיטתן ידועה; אחרת (קבוע - מטריצה סינגולרית) משמיטים אותו
+        known = data[data["with_model"].notna()].astype({"with_model": int})
+        has_method = known["with_model"].nunique() > 1 and known["student_id"].nunique() >= 3 and len(known) >= 10
+        if has_method: data = known
+        if data["student_id"].nunique() < 3 or len(data) < 10: return None
+        import statsmodels.formula.api as smf
+        formula = "score ~ t + with_model" if has_method else "score ~ t"
+        fit, err = None, None
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")   # אזהרות התכנסות נפוצות במדגם כיתתי קטן
+            for re_formula in ("~t", None):   # שיפוע אקראי, ואם לא מתכנס - חותך אקראי בלבד
+                try:
+                    fit = smf.mixedlm(formula, data, groups=data["student_id"], re_formula=re_formula).fit(reml=True)
+                    break
+                except Exception as e: err = e
+        if fit is None: return {"error": f"המודל לא התכנס: {err}"}
+        res = {
+            "n_obs": int(fit.nobs), "n_students": int(data["student_id"].nunique()),
+            "slope_per_month": float(fit.params["t"]), "slope_p": float(fit.pvalues["t"]),
+            "with_model_effect": float(fit.params["with_model"]) if has_method else None,
+            "with_model_p": float(fit.pvalues["with_model"]) if has_method else None,
+        }
+        with self._lock: self._cache[key] = res
+        return res
+
+    def update_payload(self, df: pd.DataFrame) -> dict:
+        """עדכון וסיכום תחת אותה נעילה, כך שקריאה מסשן אחר לא תשנה את הנתונים ביניהם"""
+        with self._lock: return self.update(df).payload()
+
+    def payload(self) -> dict:
+        """סיכום קומפקטי (ללא NaN) עבור הסוכן"""
+        def _clean(d): return {k: ({kk: (None if pd.isna(vv) else round(float(vv), 3)) for kk, vv in v.items()}) for k, v in d.items()}
+        return {"growth_slopes_per_month_all_class": _clean(self.class_summary().to_dict(orient="index")),
+                "work_method_contrast": _clean(self.method_contrast().to_dict(orient="index"))}
+
+    def _prepare(self, df: pd.DataFrame) -> pd.DataFrame:
+        if "date" not in df.columns or "student_id" not in df.columns:
+            return pd.DataFrame(columns=["row_id", "student_id", "t", "with_model"] + self.metrics)
+        ts = df["timestamp"].astype("string").fillna("") if "timestamp" in df.columns else ""
+        # שיטת עבודה לא ידועה (חסרה/ריקה) נשארת NA: נכנסת לשיפועים, אבל לא להשוואת השיטות ולא למודל הרב-רמתי
+        method = df["work_method"].astype("string").str.strip() if "work_method" in df.columns else pd.Series(pd.NA, index=df.index, dtype="string")
+        rows = pd.DataFrame({
+            "row_id": ts + "|" + pd.Series(df.index.astype(str), index=df.index),
+            "student_id": df["student_id"],
+            "t": (pd.to_datetime(df["date"], errors="coerce") - T0).dt.days / DAYS_PER_MONTH,
+            "with_model": method.str.contains(MODEL_PATTERN).astype("Int64").mask(method.fillna("") == ""),
+        })
+        for c in self.metrics:
+            rows[c] = pd.to_numeric(df[c], errors="coerce") if c in df.columns else np.nan
+        rows = rows[rows["student_id"].notna() & rows["t"].notna() & rows[self.metrics].notna().any(axis=1)]
+        return rows.astype({"student_id": "int64"}).reset_index(drop=True)
+
+    def _accumulate(self, rows: pd.DataFrame):
+        ids = rows["student_id"].to_numpy()
+        if ids.max() >= len(self._stats):
+            grown = np.zeros((ids.max() + 1, len(self.metrics), 6))
+            grown[:len(self._stats)] = self._stats
+            self._stats = grown
+        y = rows[self.metrics].to_numpy(dtype=float)
+        w = ~np.isnan(y)
+        y = np.where(w, y, 0.0)
+        t = np.where(w, rows["t"].to_numpy(dtype=float)[:, None], 0.0)
+        w = w.astype(float)
+        np.add.at(self._stats, ids, np.stack([w, t, y, t * t, t * y, y * y], axis=-1))
+        known = rows["with_model"].notna().to_numpy()
+        np.add.at(self._method, rows["with_model"][known].to_numpy(dtype=int), np.stack([w, y, y * y], axis=-1)[known])
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def dataset_key(df: pd.DataFrame) -> str:
+    """טביעה קצרה של העמודות שהמנוע קורא, כדי שמערכי נתונים שונים לא יחלקו מנוע"""
+    cols = [c for c in ["student_id", "date", "timestamp", "work_method"] + SCORE_COLS if c in df.columns]
+    return format(int(pd.util.hash_pandas_object(df[cols].astype("string"), index=False).sum()), "x")
+
+def get_engine(key: str) -> GrowthEngine:
+    """מנוע אחד לכל מערך נתונים (כיתה) בתהליך, כך שהחישוב משותף לכל הסשנים ומתעדכן רק בתוספות"""
+    with _engines_lock:
+        if key not in _engines:
+            if len(_engines) >= MAX_ENGINES: _engines.pop(next(iter(_engines)))
+            _engines[key] = GrowthEngine()
+        return _engines[key]
@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import pandas as pd
+
+IDENTITY_FILE = "student_identity.json"
+OTHER_NAME    = "תלמיד אחר..."   # ערך ה"אחר" ברשימת הכיתה - אינו תלמיד ולכן אין לו מזהה
+NAME_PATTERN  = r"[^א-תa-zA-Z0-9]"
+
+def normalize_names(names: pd.Series) -> pd.Series:
+    """הנרמול היחיד של שמות במערכת, על עמודה שלמה: רק אותיות עברית/לטינית וספרות, באותיות קטנות"""
+    return names.astype("string").str.replace(NAME_PATTERN, "", regex=True).str.lower().fillna("")
+
+def normalize_name(name) -> str:
+    if not isinstance(name, str): return ""
+    return normalize_names(pd.Series([name])).iat[0]
+
+class IdentityResolver:
+    """טבלת זהויות: כינוי/שגיאת כתיב -> מפתח קנוני -> מזהה מספרי. נשמרת לקובץ JSON.
+    resolve() עובד על עמודה שלמה בשני map-ים, כך שכל מקור (מאסטר, JSONL, שאלונים) מקבל אותו student_id."""
+    def __init__(self, path: str = IDENTITY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.aliases, self.ids = {}, {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f: data = json.load(f)
+                self.aliases, self.ids = data.get("aliases", {}), data.get("ids", {})
+            except Exception: pass
+
+    def canonical_keys(self, names: pd.Series) -> pd.Series:
+        keys = normalize_names(names)
+        return keys.map(self.aliases).fillna(keys).mask(names.astype("string").str.strip() == OTHER_NAME, "")
+
+    def resolve(self, names: pd.Series, register: bool = False) -> pd.Series:
+        """מחזיר student_id (Int64) לכל שם. register=True מקצה מזהים חדשים לשמות שלא נראו; אחרת הם NA"""
+        with self._lock:
+            keys = self.canonical_keys(names)
+            if register:
+                new = [k for k in keys.unique() if k and k not in self.ids]
+                if new:
+                    start = max(self.ids.values(), default=0) + 1
+                    self.ids.update({k: start + i for i, k in enumerate(new)})
+                    self._save()
+            return keys.map(self.ids).astype("Int64")
+
+    def register_roster(self, roster: list[str]):
+        self.resolve(pd.Series(roster, dtype="string"), register=True)
+
+    def add_alias(self, alias: str, canonical: str):
+        # הטבלה נשמרת שטוחה (כל כינוי מצביע ישר לשורש), כדי שה-map היחיד ב-canonical_keys יספיק
+        with self._lock:
+            key = normalize_name(alias)
+            target = normalize_name(canonical)
+            seen = set()
+            while target in self.aliases and target not in seen:
+                seen.add(target)
+                target = self.aliases[target]
+            if target == key: return   # כינוי לעצמו (ישירות או דרך שרשרת) - אין מה לעשות
+            if target not in self.ids: self.ids[target] = max(self.ids.values(), default=0) + 1
+            self.aliases = {a: (target if t == key else t) for a, t in self.aliases.items()}
+            self.aliases[key] = target
+            self._save()
+
+    def student_names(self) -> dict[int, str]:
+        return {i: k for k, i in self.ids.items()}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"aliases": self.aliases, "ids": self.ids}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+def add_student_ids(df: pd.DataFrame, name_col: str, resolver: IdentityResolver, register: bool = False) -> pd.DataFrame:
+    df["name_key"] = resolver.canonical_keys(df[name_col])
+    df["student_id"] = resolver.resolve(df[name_col], register=register)
+    return df
+
+def join_on_student(df_obs: pd.DataFrame, df_other: pd.DataFrame, how: str = "inner", suffixes=("", "_q")) -> pd.DataFrame:
+    """מיזוג בין מקורות לפי student_id בלבד (מפתח שלם מדויק)"""
+    left = df_obs[df_obs["student_id"].notna()]
+    right = df_other[df_other["student_id"].notna()]
+    return left.merge(right, on="student_id", how=how, suffixes=suffixes)
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+
+def get_identity(path: str = IDENTITY_FILE) -> IdentityResolver:
+    with _resolvers_lock:
+        if path not in _resolvers: _resolvers[path] = IdentityResolver(path)
+        return _resolvers[path]
@@ -0,0 +1,99 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from PIL import Image, ImageOps
+from drive_uploads import run_concurrent
+
+MAX_SIDE     = 1600   # הצלע הארוכה אחרי הקטנה - מספיק לקריאת שרטוט מתמונת טלפון
+JPEG_QUALITY = 85
+INDEX_FILE   = "image_index.json"
+
+def content_hash(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+def index_key(folder_id: str | None, h: str) -> str:
+    # התיקייה חלק מהמפתח: אותה תמונה בכיתה אחרת מועלית לתיקייה של אותה כיתה ולא מקבלת קישור לתיקייה זרה
+    return f"{folder_id or 'root'}:{h}"
+
+def prepare_image(raw: bytes, name: str, mime: str) -> tuple[bytes, str, str]:
+    """פענוח, יישור לפי EXIF, הקטנה וקידוד מחדש ל-JPEG. אם נכשל או שהתוצאה גדולה יותר - מחזיר את המקור"""
+    try:
+        with Image.open(io.BytesIO(raw)) as src:
+            img = ImageOps.exif_transpose(src)
+            img.thumbnail((MAX_SIDE, MAX_SIDE))
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                bg = Image.new("RGB", img.size, "white")
+                bg.paste(img, mask=img.getchannel("A"))
+                img = bg
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        data = out.getvalue()
+        if len(data) < len(raw):
+            return data, "image/jpeg", os.path.splitext(name)[0] + ".jpg"
+    except Exception:
+        pass
+    return raw, mime, name
+
+class ImageIndex:
+    """אינדקס מקומי (תיקייה, hash) -> קישור דרייב, כדי שתמונה שכבר הועלתה לתיקייה לא תועלה אליה שוב.
+    לקובץ נכתבים רק קישורים של העלאות שהושלמו (דרך on_upload_done); העלאות בדרך מוחזקות בזיכרון בלבד"""
+    def __init__(self, path: str = INDEX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._links = {}
+        self._pending = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f: self._links = json.load(f)
+            except Exception: self._links = {}
+
+    def get(self, h: str, queue=None) -> str | None:
+        """קישור אם הועלתה, הפניה pending:// אם עדיין בתור, ו-None אם לא קיימת או שההעלאה נכשלה"""
+        with self._lock:
+            if h in self._links: return self._links[h]
+            ref = self._pending.get(h)
+        if ref and queue is not None and queue.status(ref) in (None, "failed"):
+            with self._lock: self._pending.pop(h, None)
+            return None
+        return ref
+
+    def add_pending(self, h: str, ref: str):
+        with self._lock: self._pending[h] = ref
+
+    def on_upload_done(self, job: dict):
+        h = job.get("meta", {}).get("image_key")
+        if h and job.get("link"): self.update({h: job["link"]})
+
+    def update(self, new_links: dict):
+        if not new_links: return
+        with self._lock:
+            for h in new_links: self._pending.pop(h, None)
+            self._links.update(new_links)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(self._links, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+def stage_images(files: list, folder_id: str, index: ImageIndex, queue, backfill: list[str]) -> list[str]:
+    """מעבד תמונות במקביל ומכניס לתור ההעלאות. מחזיר הפניה (קישור או pending://) לכל תמונה לפי הסדר"""
+    raws   = [(f.name, f.type, f.getvalue()) for f in files]
+    hashes = [index_key(folder_id, content_hash(raw)) for _, _, raw in raws]
+
+    # כל תמונה ייחודית שאינה באינדקס מעובדת ומועלית פעם אחת בלבד
+    todo = {}
+    for h, item in zip(hashes, raws):
+        if h not in todo and index.get(h, queue) is None: todo[h] = item
+
+    def _prepare(h):
+        name, mime, raw = todo[h]
+        return prepare_image(raw, name, mime)
+
+    keys = list(todo)
+    prepared = run_concurrent(_prepare, keys)
+    for h, ((data, mime, name), _) in zip(keys, prepared):
+        index.add_pending(h, queue.enqueue(data, name, mime, folder_id, backfill=backfill, meta={"image_key": h}))
+    return [index.get(h) for h in hashes]
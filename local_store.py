@@ -0,0 +1,32 @@
+import json
+import os
+import threading
+
+# נעילה אחת לכל כתיבה לקבצים המקומיים (תצפיות, אינדקסים) - גם מה-UI וגם מה-threads ברקע
+DATA_LOCK = threading.RLock()
+
+def append_lines(path: str, lines: list[str]):
+    if not lines: return
+    with DATA_LOCK:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(l + "\n" for l in lines))
+
+def append_entries(path: str, entries: list[dict]):
+    append_lines(path, [json.dumps(e, ensure_ascii=False) for e in entries])
+
+def replace_in_file(path: str, mapping: dict) -> int:
+    """מחליף מחרוזות בקובץ (כתיבה אטומית). מחזיר את מספר ההחלפות"""
+    if not mapping or not os.path.exists(path): return 0
+    with DATA_LOCK:
+        with open(path, "r", encoding="utf-8") as f: text = f.read()
+        count = 0
+        for old, new in mapping.items():
+            n = text.count(old)
+            if n:
+                text = text.replace(old, new)
+                count += n
+        if count:
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f: f.write(text)
+            os.replace(tmp, path)
+        return count
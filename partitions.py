@@ -0,0 +1,90 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import streamlit as st
+from ai_engine import SCORE_COLS
+
+DEFAULT_PARTITION = "default"
+PARTITIONS_DIR    = "partitions"
+DEFAULT_DATA_FILE = "reflections.jsonl"   # הקובץ המקורי של הכיתה הראשית, בשורש הפרויקט
+
+def partition_data_file(pid: str) -> str:
+    """קובץ התצפיות המקומי של כיתה - המקור היחיד למיפוי הזה (האפליקציה וה-CLI)"""
+    if pid == DEFAULT_PARTITION: return DEFAULT_DATA_FILE
+    return os.path.join(PARTITIONS_DIR, pid, "reflections.jsonl")
+
+def partition_identity_file(pid: str) -> str:
+    return os.path.join(PARTITIONS_DIR, pid, "identity.json")
+
+def build_partitions(default: dict) -> dict[str, dict]:
+    """מחזיר {מזהה: הגדרות} לכל כיתה/מחזור. הכיתה המקורית נשארת 'default' עם הקבצים הקיימים,
+    ונוספות כיתות מ-secrets בפורמט:
+        [partitions.<id>]
+        label = "..."
+        roster = ["...", ...]
+        gdrive_folder_id = "..."
+        interview_folder_id = "..."
+        master_file_id = "..."
+    תיקיות שלא הוגדרו נשארות None (ולא נלקחות מהכיתה הראשית), וההעלאות לכיתה כזו נחסמות.
+    """
+    parts = {DEFAULT_PARTITION: {**default, "id": DEFAULT_PARTITION, "data_file": partition_data_file(DEFAULT_PARTITION),
+                                 "summary_file": os.path.join(PARTITIONS_DIR, DEFAULT_PARTITION, "summary.json"),
+                                 "identity_file": partition_identity_file(DEFAULT_PARTITION)}}
+    for pid, cfg in dict(st.secrets.get("partitions", {})).items():
+        folder = os.path.join(PARTITIONS_DIR, pid)
+        parts[pid] = {
+            "id": pid,
+            "label": cfg.get("label", pid),
+            "roster": list(cfg.get("roster", [])) + ["תלמיד אחר..."],
+            "gdrive_folder_id": cfg.get("gdrive_folder_id"),
+            "interview_folder_id": cfg.get("interview_folder_id"),
+            "master_file_id": cfg.get("master_file_id"),
+            "data_file": partition_data_file(pid),
+            "summary_file": os.path.join(folder, "summary.json"),
+            "identity_file": partition_identity_file(pid),
+        }
+    for p in parts.values():
+        os.makedirs(os.path.dirname(p["summary_file"]), exist_ok=True)
+        os.makedirs(os.path.dirname(p["data_file"]) or ".", exist_ok=True)
+    return parts
+
+def partition_summary(df: pd.DataFrame) -> dict:
+    """סיכום מצומצם של כיתה: ספירות וסכומים (ולא ממוצעים) כדי שאפשר יהיה לאחד כיתות במדויק"""
+    summary = {"rows": int(len(df)), "students": int(df["student_name"].nunique()) if "student_name" in df.columns else 0, "scores": {}}
+    for c in SCORE_COLS:
+        if c in df.columns:
+            v = pd.to_numeric(df[c], errors="coerce").dropna().to_numpy(dtype=float)
+            if v.size: summary["scores"][c] = {"n": int(v.size), "sum": float(v.sum()), "sumsq": float((v ** 2).sum())}
+    if "date" in df.columns:
+        d = pd.to_datetime(df["date"], errors="coerce").dropna()
+        if not d.empty: summary["last_date"] = d.max().date().isoformat()
+    return summary
+
+def write_summary(part: dict, summary: dict):
+    tmp = part["summary_file"] + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump(summary, f, ensure_ascii=False)
+    os.replace(tmp, part["summary_file"])
+
+def aggregate_view(parts: dict[str, dict]) -> pd.DataFrame:
+    """טבלה חוצת-כיתות שנבנית רק מקבצי הסיכום - בלי לטעון שורות גולמיות של אף כיתה"""
+    rows = []
+    for pid, p in parts.items():
+        if not os.path.exists(p["summary_file"]): continue
+        with open(p["summary_file"], "r", encoding="utf-8") as f: s = json.load(f)
+        rows.append({"partition": p.get("label", pid), "rows": s["rows"], "students": s["students"],
+                     "last_date": s.get("last_date"), **{f"{c}:{k}": s["scores"].get(c, {}).get(k, 0) for c in SCORE_COLS for k in ("n", "sum", "sumsq")}})
+    if not rows: return pd.DataFrame()
+    agg = pd.DataFrame(rows).set_index("partition")
+    total = agg.drop(columns=["last_date"]).sum()
+    total["last_date"] = agg["last_date"].dropna().max()
+    agg.loc["סה\"כ"] = total
+    out = agg[["rows", "students", "last_date"]].astype({"rows": int, "students": int})
+    for c in SCORE_COLS:
+        n = agg[f"{c}:n"].to_numpy(dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = agg[f"{c}:sum"].to_numpy(dtype=float) / n
+            var = (agg[f"{c}:sumsq"].to_numpy(dtype=float) - n * mean ** 2) / (n - 1)
+        out[f"{c}_mean"] = np.round(mean, 2)
+        out[f"{c}_sd"] = np.round(np.sqrt(np.clip(var, 0, None)), 2)
+    return out
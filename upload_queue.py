@@ -0,0 +1,257 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from drive_uploads import thread_service, upload_resumable, run_concurrent, MAX_WORKERS
+from local_store import DATA_LOCK, append_entries, append_lines, replace_in_file
+
+QUEUE_DIR        = "upload_queue"
+PENDING_PREFIX   = "pending://"
+MAX_STAGED_BYTES = 200 * 1024 * 1024   # מעל זה enqueue ממתין לריקון התור (backpressure)
+MAX_ATTEMPTS     = 8
+BACKOFF_BASE     = 5                   # שניות, מוכפל בכל ניסיון
+BACKOFF_MAX      = 600
+POLL_INTERVAL    = 2
+DONE_TTL         = 300                 # שניות שמשימה שהושלמה נשארת בטבלה לפני דחיסה למפת הקישורים
+LINKS_FILE       = "links.jsonl"
+
+_REF_RE = re.compile(re.escape(PENDING_PREFIX) + r"[0-9a-f]{32}")
+
+class QueueFullError(Exception):
+    pass
+
+class DriveBackend:
+    def __init__(self, creds):
+        self.creds = creds
+
+    def put(self, job: dict, content: bytes) -> str:
+        return upload_resumable(thread_service(self.creds), content, job["filename"], job["mime"],
+                                job.get("folder_id"), job.get("file_id"))
+
+class LocalDriveBackend:
+    """תחליף מקומי לדרייב - שומר לתיקייה על הדיסק. לעבודה בלי רשת ולבדיקות"""
+    def __init__(self, root: str = "local_drive"):
+        self.root = root
+
+    def put(self, job: dict, content: bytes) -> str:
+        if job.get("file_id"):
+            path = os.path.join(self.root, job["file_id"])
+        else:
+            path = os.path.join(self.root, job.get("folder_id") or "root", f"{job['id']}_{job['filename']}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f: f.write(content)
+        return "file://" + os.path.abspath(path)
+
+class UploadQueue:
+    """תור כתיבה-מאוחרת לדרייב: הקבצים נשמרים מקומית מיד, ו-thread ברקע מעלה אותם
+    ומחליף את ההפניות pending://<id> בקישורים האמיתיים בקבצים המקומיים."""
+    def __init__(self, backend, root: str = QUEUE_DIR, max_workers: int = MAX_WORKERS, max_staged_bytes: int = MAX_STAGED_BYTES):
+        self.backend = backend
+        self.root = root
+        self.max_workers = max_workers
+        self.max_staged_bytes = max_staged_bytes
+        self._cond = threading.Condition()
+        self._thread = None
+        self._listeners = []
+        self.jobs = {}
+        self.links = {}   # id -> קישור של משימות שהושלמו ונדחסו; זה כל מה ש-resolve_text צריך מהן
+        os.makedirs(root, exist_ok=True)
+        links_path = os.path.join(root, LINKS_FILE)
+        if os.path.exists(links_path):
+            with open(links_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try: rec = json.loads(line)
+                    except ValueError: continue
+                    self.links[rec["id"]] = rec["link"]
+        for fn in os.listdir(root):
+            if fn.endswith(".json"):
+                try:
+                    with open(os.path.join(root, fn), "r", encoding="utf-8") as f: job = json.load(f)
+                    self.jobs[job["id"]] = job
+                except Exception: pass
+        self._staged = sum(j["size"] for j in self.jobs.values() if j["status"] != "done")
+        self._compact(max_age=0)
+
+    # --- צד ה-UI ---
+    def enqueue(self, content: bytes, filename: str, mime: str, folder_id: str | None = None,
+                file_id: str | None = None, backfill: list[str] | None = None, timeout: float = 30,
+                meta: dict | None = None) -> str:
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._staged + len(content) > self.max_staged_bytes:
+                left = deadline - time.time()
+                if left <= 0: raise QueueFullError("תור ההעלאות מלא - הדרייב לא זמין כבר זמן רב")
+                self._cond.wait(left)
+            job = {
+                "id": uuid.uuid4().hex, "filename": filename, "mime": mime,
+                "folder_id": folder_id, "file_id": file_id, "backfill": backfill or [], "meta": meta or {},
+                "status": "pending", "attempts": 0, "next_try": 0, "size": len(content),
+                "link": None, "error": None, "created": time.time()
+            }
+            with open(self._blob_path(job["id"]), "wb") as f: f.write(content)
+            self._write_job(job)
+            self.jobs[job["id"]] = job
+            self._staged += len(content)
+            self._cond.notify_all()
+        return PENDING_PREFIX + job["id"]
+
+    def enqueue_text(self, text: str, filename: str, folder_id: str | None, **kw) -> str:
+        return self.enqueue(text.encode("utf-8"), filename, "text/plain", folder_id, **kw)
+
+    def resolve_text(self, text: str) -> str:
+        """מחליף כל הפניה שכבר הועלתה בקישור האמיתי"""
+        def _sub(m):
+            job_id = m.group()[len(PENDING_PREFIX):]
+            if job_id in self.links: return self.links[job_id]
+            job = self.jobs.get(job_id)
+            return job["link"] if job and job["status"] == "done" and job["link"] else m.group()
+        with self._cond: return _REF_RE.sub(_sub, text)
+
+    @property
+    def has_backend(self) -> bool:
+        return self.backend is not None
+
+    def status(self, ref: str) -> str | None:
+        """מצב המשימה של הפניה pending:// (pending / done / failed), או None אם אינה מוכרת"""
+        with self._cond:
+            if not ref.startswith(PENDING_PREFIX): return None
+            job_id = ref[len(PENDING_PREFIX):]
+            if job_id in self.links: return "done"
+            job = self.jobs.get(job_id)
+            return job["status"] if job else None
+
+    def add_listener(self, fn):
+        """fn(job) נקראת אחרי כל העלאה שהושלמה (מה-thread של הרקע, מחוץ לנעילות)"""
+        self._listeners.append(fn)
+
+    def save_entry(self, path: str, entry: dict):
+        # הפתרון וההוספה תחת אותה נעילה של ה-backfill, כך שאף הפניה לא "מפספסת" את ההחלפה
+        with DATA_LOCK:
+            entry = json.loads(self.resolve_text(json.dumps(entry, ensure_ascii=False)))
+            append_entries(path, [entry])
+
+    def pending_update(self, file_id: str) -> bytes | None:
+        """התוכן האחרון שממתין לדריסת file_id (למשל קובץ המאסטר), כדי שהקריאה תראה אותו כבר עכשיו"""
+        with self._cond:
+            waiting = [j for j in self.jobs.values() if j.get("file_id") == file_id and j["status"] != "done"]
+            if not waiting: return None
+            job = max(waiting, key=lambda j: j["created"])
+        try:
+            with open(self._blob_path(job["id"]), "rb") as f: return f.read()
+        except OSError: return None   # הועלה בינתיים - הדרייב כבר מעודכן
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": sum(j["status"] == "pending" for j in self.jobs.values()),
+                "failed":  sum(j["status"] == "failed"  for j in self.jobs.values()),
+                "staged_mb": round(self._staged / 1024 / 1024, 1)
+            }
+
+    def retry_failed(self):
+        with self._cond:
+            for job in self.jobs.values():
+                if job["status"] == "failed":
+                    job.update(status="pending", attempts=0, next_try=0)
+                    self._write_job(job)
+            self._cond.notify_all()
+
+    # --- צד הרקע ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="upload-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def drain_once(self) -> int:
+        """מעלה את כל המשימות שהגיע זמנן (עד max_workers*2). מחזיר כמה הושלמו"""
+        batch = self._due_jobs()
+        if not batch or self.backend is None:
+            with DATA_LOCK, self._cond: self._compact()
+            return 0
+        results = run_concurrent(self._upload, batch, self.max_workers)
+        done = {}
+        with DATA_LOCK, self._cond:
+            for job, (link, err) in zip(batch, results):
+                if err is None:
+                    self._mark_done(job, link=link, error=None)
+                    done[job["id"]] = job
+                    try: os.remove(self._blob_path(job["id"]))
+                    except OSError: pass
+                else:
+                    job["attempts"] += 1
+                    job["error"] = str(err)
+                    job["next_try"] = time.time() + min(BACKOFF_BASE * 2 ** job["attempts"], BACKOFF_MAX)
+                    if job["attempts"] >= MAX_ATTEMPTS: job["status"] = "failed"
+                self._write_job(job)
+            self._cond.notify_all()
+            by_file = {}
+            for job in done.values():
+                for path in job["backfill"]:
+                    by_file.setdefault(path, {})[PENDING_PREFIX + job["id"]] = job["link"]
+            for path, mapping in by_file.items():
+                replace_in_file(path, mapping)
+            self._compact()
+        for job in done.values():
+            for fn in self._listeners:
+                try: fn(job)
+                except Exception: pass
+        return len(done)
+
+    def _run(self):
+        while True:
+            try: n = self.drain_once()
+            except Exception: n = 0
+            if not n:
+                with self._cond: self._cond.wait(POLL_INTERVAL)
+
+    def _due_jobs(self) -> list[dict]:
+        now = time.time()
+        with self._cond:
+            due = sorted((j for j in self.jobs.values() if j["status"] == "pending" and j["next_try"] <= now),
+                         key=lambda j: j["created"])
+            # דריסות של אותו קובץ: רק הגרסה האחרונה עולה, הקודמות מסומנות כמוחלפות
+            latest = {}
+            for job in due:
+                if job.get("file_id"): latest[job["file_id"]] = job["id"]
+            batch = []
+            for job in due:
+                if job.get("file_id") and latest[job["file_id"]] != job["id"]:
+                    self._mark_done(job, link=None, error="superseded")
+                    self._write_job(job)
+                    try: os.remove(self._blob_path(job["id"]))
+                    except OSError: pass
+                    continue
+                batch.append(job)
+            return batch[:self.max_workers * 2]
+
+    def _upload(self, job: dict) -> str:
+        with open(self._blob_path(job["id"]), "rb") as f: content = f.read()
+        return self.backend.put(job, content)
+
+    def _mark_done(self, job: dict, **kw):
+        job.update(status="done", done_at=time.time(), **kw)
+        self._staged -= job["size"]
+
+    def _compact(self, max_age: float = DONE_TTL):
+        """משימות שהושלמו לפני יותר מ-max_age שניות יוצאות מהטבלה; נשאר מהן רק id -> קישור ב-links.jsonl"""
+        cutoff = time.time() - max_age
+        old = [j for j in self.jobs.values() if j["status"] == "done" and j.get("done_at", 0) <= cutoff]
+        if not old: return
+        append_lines(os.path.join(self.root, LINKS_FILE),
+                     [json.dumps({"id": j["id"], "link": j["link"]}) for j in old if j["link"]])
+        for job in old:
+            if job["link"]: self.links[job["id"]] = job["link"]
+            del self.jobs[job["id"]]
+            try: os.remove(os.path.join(self.root, job["id"] + ".json"))
+            except OSError: pass
+
+    def _blob_path(self, job_id: str) -> str:
+        return os.path.join(self.root, job_id + ".bin")
+
+    def _write_job(self, job: dict):
+        tmp = os.path.join(self.root, job["id"] + ".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.root, job["id"] + ".json"))